@@ -1,12 +1,82 @@
-from typing import Dict, Any
-import os, requests
+from typing import Dict, Any, Awaitable, Callable, List
+from types import MappingProxyType
+import asyncio, os, httpx
+
+_client: httpx.AsyncClient | None = None
+
+def get_client() -> httpx.AsyncClient:
+    # One pooled client for all providers; created lazily inside the running loop
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=15,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=32),
+        )
+    return _client
+
+async def aclose_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+class AsyncBatcher:
+    """Coalesces concurrent items into batches of up to `max_batch_size`,
+    waiting at most `max_queue_time` seconds for a batch to fill.
+
+    `flush` receives the items and returns one error (or None) per item.
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], Awaitable[List[Exception | None]]], max_batch_size: int = 50, max_queue_time: float = 0.25):
+        self._flush = flush
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self._pending: List[tuple[Any, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def process(self, item: Any) -> None:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_queue_time, self._dispatch)
+        await fut
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple[Any, asyncio.Future]]) -> None:
+        try:
+            errors = await self._flush([item for item, _ in batch])
+            if len(errors) != len(batch):
+                raise RuntimeError(f"Batch flush returned {len(errors)} results for {len(batch)} items")
+        except Exception as e:
+            errors = [e] * len(batch)
+        for (_, fut), err in zip(batch, errors):
+            if fut.done():
+                continue
+            if err is None:
+                fut.set_result(None)
+            else:
+                fut.set_exception(err)
 
 class EmailProvider:
-    def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
+    async def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
         raise NotImplementedError
 
 class DisabledProvider(EmailProvider):
-    def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
+    async def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
         # No-op
         return
 
@@ -14,48 +84,57 @@ class PostmarkProvider(EmailProvider):
     def __init__(self, api_key: str, sender: str):
         self.api_key = api_key
         self.sender = sender
+        self._url = "https://api.postmarkapp.com/email/batch"
+        self._headers = MappingProxyType({
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "X-Postmark-Server-Token": api_key,
+        })
+        # Postmark accepts up to 500 messages per batch call
+        self._batcher = AsyncBatcher(self._send_batch, max_batch_size=50, max_queue_time=0.25)
 
-    def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
-        r = requests.post(
-            "https://api.postmarkapp.com/email",
-            headers={
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "X-Postmark-Server-Token": self.api_key,
-            },
-            json={
-                "From": self.sender,
-                "To": to,
-                "Subject": subject,
-                "HtmlBody": html,
-                "TextBody": text or "",
-                "MessageStream": "outbound",
-            },
-            timeout=15,
-        )
+    async def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
+        await self._batcher.process({
+            "From": self.sender,
+            "To": to,
+            "Subject": subject,
+            "HtmlBody": html,
+            "TextBody": text or "",
+            "MessageStream": "outbound",
+        })
+
+    async def _send_batch(self, messages: List[Dict[str, Any]]) -> List[Exception | None]:
+        r = await get_client().post(self._url, headers=self._headers, json=messages)
         r.raise_for_status()
+        # One result per message, in order; ErrorCode 0 means accepted
+        return [
+            None if res.get("ErrorCode") == 0 else RuntimeError(f"Postmark error {res.get('ErrorCode')}: {res.get('Message')}")
+            for res in r.json()
+        ]
 
 class BrevoProvider(EmailProvider):
     def __init__(self, api_key: str, sender: str):
         self.api_key = api_key
         self.sender = sender
+        self._url = "https://api.brevo.com/v3/smtp/email"
+        self._headers = MappingProxyType({
+            "accept": "application/json",
+            "api-key": api_key,
+            "content-type": "application/json",
+        })
+        self._sender = {"email": sender}
 
-    def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
-        r = requests.post(
-            "https://api.brevo.com/v3/smtp/email",
-            headers={
-                "accept": "application/json",
-                "api-key": self.api_key,
-                "content-type": "application/json",
-            },
+    async def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
+        r = await get_client().post(
+            self._url,
+            headers=self._headers,
             json={
-                "sender": {"email": self.sender},
+                "sender": self._sender,
                 "to": [{"email": to}],
                 "subject": subject,
                 "htmlContent": html,
                 "textContent": text or "",
             },
-            timeout=15,
         )
         r.raise_for_status()
 
@@ -63,20 +142,22 @@ class SendgridProvider(EmailProvider):
     def __init__(self, api_key: str, sender: str):
         self.api_key = api_key
         self.sender = sender
+        self._url = "https://api.sendgrid.com/v3/mail/send"
+        self._headers = MappingProxyType({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+        self._from = {"email": sender}
 
-    def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
-        r = requests.post(
-            "https://api.sendgrid.com/v3/mail/send",
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
+    async def send(self, to: str, subject: str, html: str, text: str | None = None) -> None:
+        r = await get_client().post(
+            self._url,
+            headers=self._headers,
             json={
                 "personalizations": [{"to": [{"email": to}], "subject": subject}],
-                "from": {"email": self.sender},
+                "from": self._from,
                 "content": [{"type": "text/html", "value": html}],
             },
-            timeout=15,
         )
         r.raise_for_status()
 
@@ -1,35 +1,91 @@
-import os, secrets, time
-from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse
+import asyncio, hashlib, os, secrets, threading, time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Form, BackgroundTasks
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, Response, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from itsdangerous import TimestampSigner, BadSignature
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from . import stripe_utils
-from .email_providers import build_provider
+from .email_providers import build_provider, aclose_client
 
 load_dotenv()
 
-app = FastAPI(title="LinkMint")
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+# Templates only change on deploy; skip the per-request mtime stat
+templates.env.auto_reload = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
+
+def _templates_version() -> str:
+    # Hash of every template source, so a deploy that changes markup also changes product ETags
+    h = hashlib.sha1()
+    for root, dirs, files in os.walk(TEMPLATES_DIR):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            h.update(os.path.relpath(path, TEMPLATES_DIR).encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+RENDER_VERSION = _templates_version()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile every theme's product page up front so the first request doesn't pay for it
+    themes_dir = os.path.join(TEMPLATES_DIR, "themes")
+    for theme in os.listdir(themes_dir):
+        if os.path.isfile(os.path.join(themes_dir, theme, "product.html")):
+            templates.get_template(f"themes/{theme}/product.html")
+    yield
+    await aclose_client()
+
+app = FastAPI(title="LinkMint", lifespan=lifespan, default_response_class=ORJSONResponse)
 app.mount("/static", StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static")), name="static")
-templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
 
 signer = TimestampSigner(os.getenv("PREVIEW_TOKEN_SECRET", "change_me"))
+PREVIEW_MAX_AGE = 3600
+# Verified preview token -> expiry time, so repeat previews skip the HMAC check
+_verified_previews: TTLCache = TTLCache(maxsize=512, ttl=PREVIEW_MAX_AGE)
+_previews_lock = threading.Lock()
 email_provider = build_provider()
 
+def _check_preview(preview: str, slug: str) -> None:
+    key = (preview, slug)
+    with _previews_lock:
+        expires = _verified_previews.get(key)
+    if expires is not None and expires > time.time():
+        return
+    value, signed_at = signer.unsign(preview, max_age=PREVIEW_MAX_AGE, return_timestamp=True)
+    # Tokens are minted per slug; one slug's token must not open another product
+    if value.decode("utf-8") != slug:
+        raise BadSignature("Preview token was issued for a different product")
+    with _previews_lock:
+        _verified_previews[key] = signed_at.timestamp() + PREVIEW_MAX_AGE
+
 def _meta_from_product(prod):
     md = prod.metadata or {}
+    name = prod.name
+    description = md.get("og_description") or prod.description or ""
+    images = getattr(prod, "images", None)
     return {
-        "title": prod.name,
-        "description": md.get("og_description") or prod.description or "",
-        "og_title": md.get("og_title") or prod.name,
-        "og_description": md.get("og_description") or prod.description or "",
-        "og_image": md.get("og_image") or (prod.images[0] if getattr(prod, "images", []) else ""),
+        "title": name,
+        "description": description,
+        "og_title": md.get("og_title") or name,
+        "og_description": description,
+        "og_image": md.get("og_image") or (images[0] if images else ""),
         "slug": md.get("slug",""),
         "theme": md.get("theme","default"),
         "published": md.get("published","true"),
     }
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
 @app.get("/healthz", response_class=PlainTextResponse)
 def healthz():
     return "ok"
@@ -44,13 +100,20 @@ def product_page(request: Request, slug: str, preview: str | None = None, succes
         if not preview:
             raise HTTPException(status_code=404, detail="Product not published")
         try:
-            signer.unsign(preview, max_age=3600)
+            _check_preview(preview, slug)
         except BadSignature:
             raise HTTPException(status_code=403, detail="Invalid preview token")
     price_id = stripe_utils.default_price_for_product(prod)
     if not price_id:
         raise HTTPException(status_code=400, detail="No active price for product")
-    return templates.TemplateResponse(
+    # Stripe bumps `updated` on every product change (publish, metadata, default price)
+    etag = '"%s"' % hashlib.sha1(f"{RENDER_VERSION}:{prod.id}:{prod.updated}:{price_id}:{meta['theme']}:{success}:{cancel}".encode()).hexdigest()
+    # Previews are unpublished pages and must not end up in a shared cache
+    cache_control = "private, no-store" if preview else "public, max-age=60, stale-while-revalidate=600"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if not preview and _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response = templates.TemplateResponse(
         f"themes/{meta['theme']}/product.html",
         {
             "request": request,
@@ -61,6 +124,8 @@ def product_page(request: Request, slug: str, preview: str | None = None, succes
             "cancel": cancel,
         },
     )
+    response.headers.update(headers)
+    return response
 
 @app.post("/api/checkout/session")
 async def create_session(slug: str = Form(...), email: str | None = Form(None)):
@@ -79,39 +144,73 @@ async def create_session(slug: str = Form(...), email: str | None = Form(None)):
     )
     return RedirectResponse(url, status_code=303)
 
-@app.post("/api/stripe/webhook")
-async def stripe_webhook(request: Request):
-    payload = await request.body()
-    sig = request.headers.get("stripe-signature","")
+# Caps webhook handlers in flight under bursts. Email sends are not counted: they run
+# after the ack, and their sockets are bounded by the shared httpx client's pool.
+WEBHOOK_SEM = asyncio.Semaphore(int(os.getenv("WEBHOOK_CONCURRENCY", "32")))
+
+async def _send_email(to: str, subject: str, html: str, text: str | None = None):
+    # Runs after the webhook has been acknowledged; provider failures must not surface
+    try:
+        await email_provider.send(to, subject, html, text=text)
+    except Exception:
+        pass
+
+# Stripe retries deliveries; remember handled event ids for a day so emails go out once.
+# Per-process only: with several workers a retry can still land on a worker that hasn't seen it.
+_SEEN: TTLCache = TTLCache(maxsize=10_000, ttl=86400)
+
+# Stripe events are a few KB; anything near this is not from Stripe
+WEBHOOK_MAX_BYTES = 1_048_576
+
+async def _read_webhook_body(request: Request) -> bytes:
     try:
-        event = stripe_utils.verify_webhook(sig, payload)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Invalid signature")
-    t = event["type"]
-    data = event["data"]["object"]
-
-    # Order confirmed → send transactional email
-    if t == "checkout.session.completed":
-        customer_email = data.get("customer_details",{}).get("email")
-        line_items = []  # optional: fetch items if needed
-        slug = (data.get("metadata") or {}).get("product_slug","")
-        if customer_email and slug:
-            subject = f"Your order is confirmed"
-            html = f"<p>Thanks for your purchase of <strong>{slug}</strong>.</p>"
-            try:
-                email_provider.send(customer_email, subject, html, text=f"Order confirmed for {slug}")
-            except Exception:
-                pass
-
-    if t == "charge.refunded":
-        email = data.get("billing_details",{}).get("email")
-        if email:
-            try:
-                email_provider.send(email, "Your refund is completed", "<p>Your refund has been processed.</p>")
-            except Exception:
-                pass
-
-    return {"ok": True}
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if declared > WEBHOOK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Payload too large")
+    # The header may be absent (chunked) or wrong, so cap the stream as well
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > WEBHOOK_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Payload too large")
+    return bytes(body)
+
+@app.post("/api/stripe/webhook")
+async def stripe_webhook(request: Request, background: BackgroundTasks):
+    # Read the (capped) body first so slow clients can't sit on a permit
+    payload = await _read_webhook_body(request)
+    async with WEBHOOK_SEM:
+        sig = request.headers.get("stripe-signature","")
+        try:
+            event = await asyncio.to_thread(stripe_utils.verify_webhook, sig, payload)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail="Invalid signature")
+        eid = event["id"]
+        if eid in _SEEN:
+            return {"ok": True, "deduped": True}
+        t = event["type"]
+        data = event["data"]["object"]
+
+        # Order confirmed → send transactional email
+        if t == "checkout.session.completed":
+            customer_email = data.get("customer_details",{}).get("email")
+            line_items = []  # optional: fetch items if needed
+            slug = (data.get("metadata") or {}).get("product_slug","")
+            if customer_email and slug:
+                subject = f"Your order is confirmed"
+                html = f"<p>Thanks for your purchase of <strong>{slug}</strong>.</p>"
+                background.add_task(_send_email, customer_email, subject, html, text=f"Order confirmed for {slug}")
+
+        if t == "charge.refunded":
+            email = data.get("billing_details",{}).get("email")
+            if email:
+                background.add_task(_send_email, email, "Your refund is completed", "<p>Your refund has been processed.</p>")
+
+        # Only once handling succeeded, so a failed attempt is processed again on Stripe's retry
+        _SEEN[eid] = 1
+        return {"ok": True}
 
 @app.get("/self")
 def portal(request: Request):
@@ -1,8 +1,16 @@
-import os, stripe
+import os, orjson, stripe, threading
 from typing import Any, Dict
+from cachetools import TTLCache
 
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "")
 
+# Product pages hit Stripe on every request; keep lookups in-process for a while.
+# A price's `active` flag can be flipped from the Dashboard, so it ages out with products.
+PRODUCT_CACHE_TTL = int(os.getenv("PRODUCT_CACHE_TTL", "300"))
+_products_by_slug: TTLCache = TTLCache(maxsize=1024, ttl=PRODUCT_CACHE_TTL)
+_active_prices: TTLCache = TTLCache(maxsize=4096, ttl=PRODUCT_CACHE_TTL)
+_cache_lock = threading.Lock()
+
 def build_success_url(slug: str, order_public_id: str) -> str:
     template = os.getenv("STRIPE_SUCCESS_URL_BASE", f"{os.getenv('BASE_URL','http://localhost:8000')}/p/{{slug}}?success=1&op={{order_public_id}}")
     return template.replace("{{slug}}", slug).replace("{{order_public_id}}", order_public_id)
@@ -26,30 +34,46 @@ def create_checkout_session(slug: str, price_id: str, customer_email: str | None
 
 def verify_webhook(sig_header: str, payload: bytes):
     wh_secret = os.getenv("STRIPE_WEBHOOK_SECRET", "")
-    return stripe.Webhook.construct_event(payload=payload, sig_header=sig_header, secret=wh_secret)
+    # Same checks as stripe.Webhook.construct_event, but parse the body with orjson
+    stripe.WebhookSignature.verify_header(payload.decode("utf-8"), sig_header, wh_secret, stripe.Webhook.DEFAULT_TOLERANCE)
+    return stripe.Event.construct_from(orjson.loads(payload), stripe.api_key)
 
 def find_product_by_slug(slug: str):
-    # Stripe doesn't index metadata; filter client-side
-    # Fetch all active products and filter client-side
-    products = stripe.Product.list(active=True)
-    for p in products.auto_paging_iter():
-        if p.metadata.get("slug") == slug:
-            return p
-    return None
+    with _cache_lock:
+        cached = _products_by_slug.get(slug)
+    if cached is not None:
+        return cached
+    # Search indexes metadata, so this is one request instead of paging every product
+    # Escape backslashes first so they can't swallow the escape added for quotes
+    quoted = slug.replace("\\", "\\\\").replace("'", "\\'")
+    res = stripe.Product.search(query=f"active:'true' AND metadata['slug']:'{quoted}'", limit=1, expand=["data.default_price"])
+    p = next(iter(res.data), None)
+    if p is not None:
+        with _cache_lock:
+            _products_by_slug[slug] = p
+    return p
+
+def _price_is_active(price_id: str) -> bool:
+    with _cache_lock:
+        active = _active_prices.get(price_id)
+    if active is None:
+        active = bool(stripe.Price.retrieve(price_id).active)
+        with _cache_lock:
+            _active_prices[price_id] = active
+    return active
 
 def default_price_for_product(product) -> str | None:
     # Prefer default_price if active, else first active price
     dp = product.get("default_price") if isinstance(product, dict) else getattr(product, "default_price", None)
-    price = dp if isinstance(dp, str) else (dp.get("id") if dp else None)
-    if price:
-        pr = stripe.Price.retrieve(price)
-        if pr.active:
-            return pr.id
-    # fallback
-    prices = stripe.Price.list(product=product.id, active=True, limit=10)
-    if prices.data:
-        return prices.data[0].id
-    return None
+    if dp and not isinstance(dp, str):
+        # Expanded by the search call: the price object already carries `active`
+        if dp.get("active"):
+            return dp.get("id")
+    elif dp and _price_is_active(dp):
+        return dp
+    # fallback: let Stripe filter server-side and return a single price
+    prices = stripe.Price.search(query=f"product:'{product.id}' AND active:'true'", limit=1)
+    return next((pr.id for pr in prices.data), None)
 
 def create_billing_portal_session(customer_id: str, return_url: str) -> str:
     session = stripe.billing_portal.Session.create(customer=customer_id, return_url=return_url)
@@ -57,3 +81,7 @@ def create_billing_portal_session(customer_id: str, return_url: str) -> str:
 
 def archive_price(price_id: str):
     stripe.Price.modify(price_id, active=False)
+    with _cache_lock:
+        _active_prices.pop(price_id, None)
+        # cached products may carry this price expanded as their default
+        _products_by_slug.clear()
@@ -1,5 +1,5 @@
-import os, json, typer, requests, webbrowser, pathlib, sys
-from dotenv import load_dotenv
+import os, json, typer, httpx, asyncio, webbrowser, pathlib, sys
+from dotenv import load_dotenv, set_key
 import stripe
 from rich.console import Console
 from rich.table import Table
@@ -27,25 +27,19 @@ BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
 if STRIPE_KEY:
     stripe.api_key = STRIPE_KEY
 
+def _set_env(name: str, value: str):
+    p = pathlib.Path(".env")
+    p.touch(exist_ok=True)
+    # Rewrites the file once, replacing the line in place or appending it
+    set_key(p, name, value, quote_mode="never")
+
 @app.command("stripe:set-key")
 def stripe_set_key(key: str):
     """Sets the Stripe secret key in the .env file.
 
     This key is essential for authenticating with the Stripe API.
     """
-    p = pathlib.Path(".env")
-    text = p.read_text() if p.exists() else ""
-    lines = []
-    found = False
-    for line in text.splitlines():
-        if line.startswith("STRIPE_SECRET_KEY="):
-            lines.append(f"STRIPE_SECRET_KEY={key}")
-            found = True
-        else:
-            lines.append(line)
-    if not found:
-        lines.append(f"STRIPE_SECRET_KEY={key}")
-    p.write_text("\n".join(lines) + "\n")
+    _set_env("STRIPE_SECRET_KEY", key)
     typer.echo("Updated .env STRIPE_SECRET_KEY")
 
 @app.command("printful:set-key")
@@ -54,19 +48,7 @@ def printful_set_key(key: str):
 
     This key is required for authenticating with the Printful API.
     """
-    p = pathlib.Path(".env")
-    text = p.read_text() if p.exists() else ""
-    lines = []
-    found = False
-    for line in text.splitlines():
-        if line.startswith("PRINTFUL_API_KEY="):
-            lines.append(f"PRINTFUL_API_KEY={key}")
-            found = True
-        else:
-            lines.append(line)
-    if not found:
-        lines.append(f"PRINTFUL_API_KEY={key}")
-    p.write_text("\n".join(lines) + "\n")
+    _set_env("PRINTFUL_API_KEY", key)
     typer.echo("Updated .env PRINTFUL_API_KEY")
 
 @app.command("printful:set-store-id")
@@ -75,19 +57,7 @@ def printful_set_store_id(store_id: str):
 
     This ID is used to identify your specific Printful store when making API requests.
     """
-    p = pathlib.Path(".env")
-    text = p.read_text() if p.exists() else ""
-    lines = []
-    found = False
-    for line in text.splitlines():
-        if line.startswith("PRINTFUL_STORE_ID="):
-            lines.append(f"PRINTFUL_STORE_ID={store_id}")
-            found = True
-        else:
-            lines.append(line)
-    if not found:
-        lines.append(f"PRINTFUL_STORE_ID={store_id}")
-    p.write_text("\n".join(lines) + "\n")
+    _set_env("PRINTFUL_STORE_ID", store_id)
     typer.echo("Updated .env PRINTFUL_STORE_ID")
 
 def _get_stripe_products():
@@ -100,27 +70,42 @@ def _get_stripe_products():
     print(f"DEBUG: Found {len(products_list)} active products in Stripe.")
     return products_list
 
-def _get_printful_products(store_id: str = PRINTFUL_STORE_ID):
-    if not PRINTFUL_KEY:
-        typer.echo("PRINTFUL_API_KEY missing")
-        raise typer.Exit(1)
-    if not store_id:
-        typer.echo("PRINTFUL_STORE_ID missing. Please set it in .env or provide with --store-id.")
-        raise typer.Exit(1)
-    r = requests.get("https://api.printful.com/store/products", headers={"Authorization": f"Bearer {PRINTFUL_KEY}", "X-PF-Store-Id": store_id}, timeout=20)
-    r.raise_for_status()
-    return r.json().get("result", [])
+PRINTFUL_PAGE_SIZE = 100
+_SLUG_TABLE = str.maketrans({" ": "-", "/": "-"})
 
-def _get_printful_product_details(printful_product_id: int, store_id: str):
+def _printful_client(store_id: str) -> httpx.AsyncClient:
     if not PRINTFUL_KEY:
         typer.echo("PRINTFUL_API_KEY missing")
         raise typer.Exit(1)
     if not store_id:
         typer.echo("PRINTFUL_STORE_ID missing. Please set it in .env or provide with --store-id.")
         raise typer.Exit(1)
-    r = requests.get(f"https://api.printful.com/store/products/{printful_product_id}", headers={"Authorization": f"Bearer {PRINTFUL_KEY}", "X-PF-Store-Id": store_id}, timeout=20)
-    r.raise_for_status()
-    return r.json().get("result", {})
+    return httpx.AsyncClient(
+        base_url="https://api.printful.com",
+        headers={"Authorization": f"Bearer {PRINTFUL_KEY}", "X-PF-Store-Id": store_id},
+        timeout=20,
+    )
+
+async def _get_printful_products(store_id: str = PRINTFUL_STORE_ID):
+    async with _printful_client(store_id) as client:
+        r = await client.get("/store/products", params={"limit": PRINTFUL_PAGE_SIZE})
+        r.raise_for_status()
+        body = r.json()
+        products = body.get("result", [])
+        # Once the total is known, fetch the remaining pages concurrently
+        total = (body.get("paging") or {}).get("total", len(products))
+        offsets = range(len(products), total, PRINTFUL_PAGE_SIZE) if products else ()
+        pages = await asyncio.gather(*[client.get("/store/products", params={"offset": o, "limit": PRINTFUL_PAGE_SIZE}) for o in offsets])
+        for page in pages:
+            page.raise_for_status()
+            products.extend(page.json().get("result", []))
+    return products
+
+async def _get_printful_product_details(printful_product_id: int, store_id: str):
+    async with _printful_client(store_id) as client:
+        r = await client.get(f"/store/products/{printful_product_id}")
+        r.raise_for_status()
+        return r.json().get("result", {})
 
 @app.command("printful:product")
 def printful_product(printful_product_id: int, store_id: str = typer.Option(PRINTFUL_STORE_ID, "--store-id")):
@@ -128,7 +113,7 @@ def printful_product(printful_product_id: int, store_id: str = typer.Option(PRIN
 
     The product is identified by its Printful product ID.
     """
-    product_details = _get_printful_product_details(printful_product_id, store_id)
+    product_details = asyncio.run(_get_printful_product_details(printful_product_id, store_id))
     console.print(Panel(json.dumps(product_details, indent=2), title=f"[bold green]Details for Printful Product ID: {printful_product_id}[/bold green]", border_style="green"))
 
 @app.command("printful:ui")
@@ -142,10 +127,20 @@ def printful_ui(store_id: str = typer.Option(PRINTFUL_STORE_ID, "--store-id")):
         raise typer.Exit(1)
     console.print("[bold green]Printful UI[/bold green]")
 
+    # Stripe and Printful are independent; fetch both at once
+    async def _fetch_all():
+        return await asyncio.gather(
+            asyncio.to_thread(_get_stripe_products),
+            _get_printful_products(store_id),
+            return_exceptions=True,
+        )
+    stripe_products, printful_products = asyncio.run(_fetch_all())
+
     # Live Products View
     console.print("\n[bold blue]Live Products (Stripe)[/bold blue]")
     try:
-        stripe_products = _get_stripe_products()
+        if isinstance(stripe_products, Exception):
+            raise stripe_products
         
         live_products_table = Table(title="Live Products")
         live_products_table.add_column("ID", style="cyan", no_wrap=True)
@@ -180,7 +175,8 @@ def printful_ui(store_id: str = typer.Option(PRINTFUL_STORE_ID, "--store-id")):
     # Available Printful Products View
     console.print("\n[bold blue]Available Printful Products (Printful Store)[/bold blue]")
     try:
-        printful_products = _get_printful_products(store_id)
+        if isinstance(printful_products, Exception):
+            raise printful_products
         if not printful_products:
             console.print("No products found in your Printful store.")
             return
@@ -195,7 +191,7 @@ def printful_ui(store_id: str = typer.Option(PRINTFUL_STORE_ID, "--store-id")):
         
         console.print(table)
 
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         console.print(f"[bold red]Error fetching Printful products:[/bold red] {e}")
     except Exception as e:
         console.print(f"[bold red]An unexpected error occurred:[/bold red] {e}")
@@ -206,21 +202,13 @@ def printful_list(search: str = typer.Option("", "--search"), store_id: str = ty
 
     Optionally filters products by a search term.
     """
-    if not PRINTFUL_KEY:
-        typer.echo("PRINTFUL_API_KEY missing")
-        raise typer.Exit(1)
-    if not store_id:
-        typer.echo("PRINTFUL_STORE_ID missing. Please set it in .env or provide with --store-id.")
-        raise typer.Exit(1)
-    r = requests.get("https://api.printful.com/store/products", headers={"Authorization": f"Bearer {PRINTFUL_KEY}", "X-PF-Store-Id": store_id}, timeout=20)
-    r.raise_for_status()
-    data = r.json().get("result", [])
+    data = asyncio.run(_get_printful_products(store_id))
     for p in data:
         if search.lower() in (p.get("name") or "").lower():
             typer.echo(f"{p.get('id')}: {p.get('name')}")
 
 @app.command("printful:import")
-def printful_import(printful_product_id: int, currency: str = typer.Option("EUR", "--currency"), theme: str = typer.Option("default", "--theme"), store_id: str = typer.Option(PRINTFUL_STORE_ID, "--store-id")):
+def printful_import(printful_product_id: int, currency: str = typer.Option("EUR", "--currency"), theme: str = typer.Option("default", "--theme"), store_id: str = typer.Option(PRINTFUL_STORE_ID, "--store-id"), idempotency_key: str = typer.Option("", "--idempotency-key", help="Reuse the same key to retry a failed import without creating a duplicate (Stripe keeps keys for 24h).")):
     """Imports a Printful product into Stripe, creating a new Stripe product and price.
 
     The retail price is automatically derived from the Printful product's first variant.
@@ -232,7 +220,10 @@ def printful_import(printful_product_id: int, currency: str = typer.Option("EUR"
         typer.echo("PRINTFUL_STORE_ID missing. Please set it in .env or provide with --store-id.")
         raise typer.Exit(1)
 
-    prod_details = _get_printful_product_details(printful_product_id, store_id)
+    prod_details = asyncio.run(_get_printful_product_details(printful_product_id, store_id))
+    _import_printful_product(printful_product_id, prod_details, currency, theme, idempotency_key or None)
+
+def _import_printful_product(printful_product_id: int, prod_details: dict, currency: str, theme: str, idempotency_key: str | None = None):
     if not prod_details:
         typer.echo(f"Could not find Printful product with ID {printful_product_id}")
         raise typer.Exit(1)
@@ -266,37 +257,103 @@ def printful_import(printful_product_id: int, currency: str = typer.Option("EUR"
     # Use the mockup image if found, otherwise fallback to the product image
     image_to_use = mockup_image if mockup_image else (prod_details["sync_variants"][0]["product"].get("image", "") if prod_details.get("sync_variants") and prod_details["sync_variants"][0].get("product") else "")
 
-    slug = title.lower().replace(" ","-").replace("/","-")
-    sprod = stripe.Product.create(
-        name=title,
-        description=title,
-        images=[image_to_use] if image_to_use else [],
-        metadata={
-            "slug": slug,
-            "og_title": title,
-            "og_description": title,
-            "og_image": image_to_use,
-            "printful_product_id": str(printful_product_id),
-            "printful_product_name": prod_details.get("sync_product", {}).get("name", ""),
-            "printful_variant_name": prod_details.get("sync_variants", [{}])[0].get("product", {}).get("name", ""),
-            "printful_variant_size": prod_details.get("sync_variants", [{}])[0].get("size", ""),
-            "theme": theme,
-            "published": "false",
-        },
-    )
-    price = stripe.Price.create(
-        unit_amount=price_cents,
-        currency=currency.lower(),
-        product=sprod.id
-    )
-    # set default price
-    stripe.Product.modify(sprod.id, default_price=price.id)
+    slug = title.lower().translate(_SLUG_TABLE)
+    try:
+        sprod = stripe.Product.create(
+            name=title,
+            description=title,
+            images=[image_to_use] if image_to_use else [],
+            metadata={
+                "slug": slug,
+                "og_title": title,
+                "og_description": title,
+                "og_image": image_to_use,
+                "printful_product_id": str(printful_product_id),
+                "printful_product_name": prod_details.get("sync_product", {}).get("name", ""),
+                "printful_variant_name": prod_details.get("sync_variants", [{}])[0].get("product", {}).get("name", ""),
+                "printful_variant_size": prod_details.get("sync_variants", [{}])[0].get("size", ""),
+                "theme": theme,
+                "published": "false",
+            },
+            # Creates the price and sets it as default in the same request
+            default_price_data={
+                "unit_amount": price_cents,
+                "currency": currency.lower(),
+            },
+            # Only sent when asked for: retrying with the same key returns the first product
+            idempotency_key=idempotency_key,
+        )
+    except stripe.error.IdempotencyError:
+        typer.echo(f"Idempotency key {idempotency_key!r} was already used with different parameters. Use a new key, or rerun with the same options as the first import.")
+        raise typer.Exit(1)
+    price_id = sprod.default_price
     url = f"{BASE_URL}/p/{slug}"
-    typer.echo(f"Debug: sprod.id={sprod.id}, price.id={price.id}")
-    typer.echo(f"Imported → Stripe Product {sprod.id}, Price {price.id}")
+    typer.echo(f"Debug: sprod.id={sprod.id}, price.id={price_id}")
+    typer.echo(f"Imported → Stripe Product {sprod.id}, Price {price_id}")
     typer.echo(f"Preview: {url} (unpublished)")
     return
 
+PRINTFUL_FETCH_CONCURRENCY = 8
+
+async def _fetch_many(printful_product_ids: list[int], store_id: str):
+    # One client, a few detail requests in flight at a time (Printful rate-limits to ~120/min);
+    # failures are returned per product
+    sem = asyncio.Semaphore(PRINTFUL_FETCH_CONCURRENCY)
+
+    async def _get(client, printful_product_id):
+        async with sem:
+            return await client.get(f"/store/products/{printful_product_id}")
+
+    async with _printful_client(store_id) as client:
+        responses = await asyncio.gather(*[_get(client, i) for i in printful_product_ids], return_exceptions=True)
+    results = []
+    for r in responses:
+        if isinstance(r, Exception):
+            results.append(r)
+        elif r.is_error:
+            results.append(httpx.HTTPStatusError(f"{r.status_code} for {r.url}", request=r.request, response=r))
+        else:
+            results.append(r.json().get("result", {}))
+    return results
+
+@app.command("printful:import-bulk")
+def printful_import_bulk(printful_product_ids: list[int], currency: str = typer.Option("EUR", "--currency"), theme: str = typer.Option("default", "--theme"), store_id: str = typer.Option(PRINTFUL_STORE_ID, "--store-id"), idempotency_key: str = typer.Option("", "--idempotency-key", help="Key prefix; each product uses <key>:<printful_product_id>, so a retried run skips products already created.")):
+    """Imports several Printful products into Stripe, like printful:import for each ID.
+
+    Printful details are fetched concurrently and up to 8 Stripe imports run at once.
+    """
+    if not PRINTFUL_KEY or not STRIPE_KEY:
+        typer.echo("PRINTFUL_API_KEY or STRIPE_SECRET_KEY missing")
+        raise typer.Exit(1)
+    if not store_id:
+        typer.echo("PRINTFUL_STORE_ID missing. Please set it in .env or provide with --store-id.")
+        raise typer.Exit(1)
+
+    async def _import_all():
+        details = await _fetch_many(printful_product_ids, store_id)
+        sem = asyncio.Semaphore(8)
+
+        async def _import_one(printful_product_id, prod_details):
+            if isinstance(prod_details, Exception):
+                raise prod_details
+            async with sem:
+                key = f"{idempotency_key}:{printful_product_id}" if idempotency_key else None
+                await asyncio.to_thread(_import_printful_product, printful_product_id, prod_details, currency, theme, key)
+
+        return await asyncio.gather(*[_import_one(i, d) for i, d in zip(printful_product_ids, details)], return_exceptions=True)
+
+    results = asyncio.run(_import_all())
+    failed = 0
+    for printful_product_id, res in zip(printful_product_ids, results):
+        if isinstance(res, typer.Exit):
+            failed += 1  # reason already printed by _import_printful_product
+        elif isinstance(res, Exception):
+            failed += 1
+            typer.echo(f"Failed to import Printful product {printful_product_id}: {res}")
+    typer.echo(f"Imported {len(printful_product_ids) - failed} of {len(printful_product_ids)} products")
+    if failed:
+        raise typer.Exit(1)
+
 @app.command("product:publish")
 def product_publish(slug: str):
     """Publishes a product by setting its 'published' metadata to 'true' in Stripe."""
@@ -306,7 +363,7 @@ def product_publish(slug: str):
 
     # Search for the product by slug in metadata
     # Stripe's search query for metadata is 'metadata["slug"]:"<slug>"'
-    products = stripe.Product.search(query=f'metadata["slug"]:"{slug}"').data
+    products = stripe.Product.search(query=f'metadata["slug"]:"{slug}"', limit=1).data
 
     if not products:
         typer.echo(f"No product found with slug: {slug}")
@@ -0,0 +1,46 @@
+import asyncio, pathlib, sys
+from types import SimpleNamespace
+import httpx
+import pytest
+from typer.testing import CliRunner
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent / "cli"))
+import linkmint_cli
+
+def _details(printful_product_id):
+    return {"result": {
+        "name": f"Shirt {printful_product_id}",
+        "sync_variants": [{"retail_price": "19.99", "files": [], "product": {}}],
+    }}
+
+@pytest.fixture
+def printful(monkeypatch):
+    state = {"in_flight": 0, "max_in_flight": 0}
+
+    async def handler(request):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        printful_product_id = int(request.url.path.rsplit("/", 1)[-1])
+        if printful_product_id == 2:
+            return httpx.Response(404, json={"error": "not found"})
+        return httpx.Response(200, json=_details(printful_product_id))
+
+    monkeypatch.setattr(linkmint_cli, "PRINTFUL_KEY", "pf_test")
+    monkeypatch.setattr(linkmint_cli, "STRIPE_KEY", "sk_test")
+    monkeypatch.setattr(linkmint_cli, "_printful_client", lambda store_id: httpx.AsyncClient(base_url="https://api.printful.com", transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(linkmint_cli.stripe.Product, "create", lambda **kw: SimpleNamespace(id="prod_1", default_price="price_1"))
+    return state
+
+def test_import_bulk_reports_partial_failure(printful):
+    result = CliRunner().invoke(linkmint_cli.app, ["printful:import-bulk", "1", "2", "3", "--store-id", "store"])
+    assert result.exit_code == 1
+    assert "Failed to import Printful product 2" in result.output
+    assert "Imported 2 of 3 products" in result.output
+
+def test_import_bulk_bounds_printful_concurrency(printful):
+    ids = [str(i) for i in range(10, 40)]
+    result = CliRunner().invoke(linkmint_cli.app, ["printful:import-bulk", *ids, "--store-id", "store"])
+    assert result.exit_code == 0
+    assert printful["max_in_flight"] <= linkmint_cli.PRINTFUL_FETCH_CONCURRENCY
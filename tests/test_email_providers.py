@@ -0,0 +1,28 @@
+import asyncio
+from app.email_providers import AsyncBatcher
+
+def test_batcher_groups_items_and_reports_per_item_errors():
+    calls = []
+
+    async def flush(items):
+        calls.append(list(items))
+        return [ValueError(i) if i % 3 == 0 else None for i in items]
+
+    async def run():
+        batcher = AsyncBatcher(flush, max_batch_size=4, max_queue_time=0.01)
+        return await asyncio.gather(*[batcher.process(i) for i in range(10)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert calls == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert [isinstance(r, ValueError) for r in results] == [i % 3 == 0 for i in range(10)]
+
+def test_batcher_fails_all_items_on_short_flush_result():
+    async def flush(items):
+        return [None]
+
+    async def run():
+        batcher = AsyncBatcher(flush, max_batch_size=2, max_queue_time=0.01)
+        return await asyncio.wait_for(asyncio.gather(batcher.process("a"), batcher.process("b"), return_exceptions=True), timeout=1)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from app import main, stripe_utils
+
+def _unpublished(slug):
+    return SimpleNamespace(
+        id=f"prod_{slug}", name=slug, description="", images=[], updated=1,
+        metadata={"slug": slug, "published": "false"}, default_price="price_1",
+    )
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(stripe_utils, "find_product_by_slug", _unpublished)
+    monkeypatch.setattr(stripe_utils, "default_price_for_product", lambda prod: "price_1")
+    return TestClient(main.app)
+
+def test_preview_token_opens_its_own_product(client):
+    token = client.get("/preview-token/shirt").json()["preview"]
+    assert client.get("/p/shirt", params={"preview": token}).status_code == 200
+
+def test_preview_token_for_other_slug_is_rejected(client):
+    token = client.get("/preview-token/other").json()["preview"]
+    assert client.get("/p/shirt", params={"preview": token}).status_code == 403
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from app import main, stripe_utils
+
+def _published(slug):
+    return SimpleNamespace(
+        id=f"prod_{slug}", name=slug, description="", images=[], updated=1,
+        metadata={"slug": slug, "published": "true"}, default_price="price_1",
+    )
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(stripe_utils, "find_product_by_slug", _published)
+    monkeypatch.setattr(stripe_utils, "default_price_for_product", lambda prod: "price_1")
+    return TestClient(main.app)
+
+def test_unchanged_page_revalidates_with_304(client):
+    etag = client.get("/p/shirt").headers["etag"]
+    assert client.get("/p/shirt", headers={"If-None-Match": etag}).status_code == 304
+
+def test_etag_changes_with_render_version(client, monkeypatch):
+    etag = client.get("/p/shirt").headers["etag"]
+    monkeypatch.setattr(main, "RENDER_VERSION", "next-deploy")
+    r = client.get("/p/shirt", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
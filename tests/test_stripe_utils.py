@@ -0,0 +1,19 @@
+from types import SimpleNamespace
+import pytest
+from app import stripe_utils
+
+@pytest.mark.parametrize("slug, expected", [
+    ("shirt", "metadata['slug']:'shirt'"),
+    ("men's-tee", "metadata['slug']:'men\\'s-tee'"),
+    ("a\\", "metadata['slug']:'a\\\\'"),
+])
+def test_find_product_by_slug_escapes_search_query(monkeypatch, slug, expected):
+    queries = []
+
+    def search(query, **kwargs):
+        queries.append(query)
+        return SimpleNamespace(data=[])
+
+    monkeypatch.setattr(stripe_utils.stripe.Product, "search", search)
+    assert stripe_utils.find_product_by_slug(slug) is None
+    assert queries == [f"active:'true' AND {expected}"]
@@ -0,0 +1,44 @@
+import hashlib, hmac, json, time
+from fastapi.testclient import TestClient
+from app import main
+
+SECRET = "whsec_test"
+
+def _signed(payload: bytes, timestamp: int) -> str:
+    sig = hmac.new(SECRET.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={sig}"
+
+def _event(eid: str) -> bytes:
+    return json.dumps({"id": eid, "object": "event", "type": "ping", "data": {"object": {}}}).encode()
+
+def test_webhook_accepts_fresh_signature(monkeypatch):
+    monkeypatch.setenv("STRIPE_WEBHOOK_SECRET", SECRET)
+    payload = _event("evt_fresh")
+    r = TestClient(main.app).post("/api/stripe/webhook", content=payload, headers={"stripe-signature": _signed(payload, int(time.time()))})
+    assert r.status_code == 200
+    assert r.json()["ok"] is True
+
+def test_webhook_rejects_stale_signature(monkeypatch):
+    monkeypatch.setenv("STRIPE_WEBHOOK_SECRET", SECRET)
+    payload = _event("evt_stale")
+    two_days_ago = int(time.time()) - 2 * 86400
+    r = TestClient(main.app).post("/api/stripe/webhook", content=payload, headers={"stripe-signature": _signed(payload, two_days_ago)})
+    assert r.status_code == 400
+
+def test_webhook_dedupes_repeated_event(monkeypatch):
+    monkeypatch.setenv("STRIPE_WEBHOOK_SECRET", SECRET)
+    client = TestClient(main.app)
+    payload = _event("evt_repeat")
+    first = client.post("/api/stripe/webhook", content=payload, headers={"stripe-signature": _signed(payload, int(time.time()))})
+    second = client.post("/api/stripe/webhook", content=payload, headers={"stripe-signature": _signed(payload, int(time.time()))})
+    assert first.json() == {"ok": True}
+    assert second.json() == {"ok": True, "deduped": True}
+
+def test_webhook_failed_event_is_not_marked_seen(monkeypatch):
+    monkeypatch.setenv("STRIPE_WEBHOOK_SECRET", SECRET)
+    client = TestClient(main.app, raise_server_exceptions=False)
+    # An event without data fails in the handler; the retry must not be deduped
+    payload = json.dumps({"id": "evt_fails", "object": "event", "type": "ping"}).encode()
+    r = client.post("/api/stripe/webhook", content=payload, headers={"stripe-signature": _signed(payload, int(time.time()))})
+    assert r.status_code == 500
+    assert "evt_fails" not in main._SEEN